@@ -71,10 +71,9 @@ def build_reports(
     sales_detail["precio_unit"] = pd.to_numeric(sales_detail["precio_unit"], errors="coerce")
     sales_detail["importe"]     = pd.to_numeric(sales_detail["importe"], errors="coerce")
 
-    # Si importe viene vacío, lo calculamos
-    mask_imp = sales_detail["importe"].isna()
-    sales_detail.loc[mask_imp, "importe"] = (
-        sales_detail.loc[mask_imp, "cantidad"].astype(float) * sales_detail.loc[mask_imp, "precio_unit"].astype(float)
+    # Si importe viene vacío, lo calculamos (una sola pasada, sin máscara ni .loc)
+    sales_detail["importe"] = sales_detail["importe"].fillna(
+        sales_detail["cantidad"].astype(float) * sales_detail["precio_unit"]
     )
 
     # Producción (opcional)
@@ -1,11 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json, os, re, secrets, hashlib
+import csv, functools, html, json, os, re, secrets, hashlib, sys, time
+from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
+try:
+    import orjson                    # opcional: (de)serialización JSON más rápida
+    _json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+
+try:
+    import pyarrow as pa             # opcional: lector de CSV multihilo
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
 ROOT = Path(__file__).resolve().parents[1]
 DATA = ROOT / "data"
 DOCS = ROOT / "docs"
@@ -13,6 +28,10 @@ DIARIO_DIR = DOCS / "diario"
 MKT_DIR = DOCS / "mercado"
 MKT_DIARIO_DIR = MKT_DIR / "diario"
 
+# Los archivos de data/ se quedan en CSV (no Parquet): se editan a mano, sus
+# conflictos de git se resuelven como texto (ver _load_inventory_file) y el
+# workflow sólo instala pandas. Son pocos cientos de filas.
+
 # --- archivos (general) ---
 INVENTORY_CSV = DATA / "inventory.csv"
 SALES_CSV     = DATA / "sales.csv"
@@ -42,39 +61,73 @@ SALES_MKT_DAY_CSV    = MKT_DIR / "ventas_por_dia.csv"   # opcional útil
 # Utilidades
 # ============================================================
 
+# Cache de stat por ruta: una sola llamada al sistema por archivo por corrida.
+# Quien escribe un archivo lo invalida con _forget_stat().
+_FS: dict = {}
+
+def _stat(path: Path):
+    if path not in _FS:
+        try:
+            _FS[path] = path.stat()
+        except FileNotFoundError:
+            _FS[path] = None
+    return _FS[path]
+
+def _forget_stat(path: Path):
+    _FS.pop(path, None)
+
+def _has_data(path: Path) -> bool:
+    st = _stat(path)
+    return st is not None and st.st_size > 0
+
+# Archivos de datos y su encabezado inicial
+_SEED_FILES = [
+    (INVENTORY_CSV,     "item,descripcion,stock,precio,product_id\n"),
+    (SALES_CSV,         "txn_id,fecha,item,cantidad,precio_unit,importe,issue,metodo_pago,source_id\n"),
+    (PROD_CSV,          "txn_id,fecha,item,cantidad,issue\n"),
+    (INVENTORY_MKT_CSV, "item,descripcion,stock,precio,product_id\n"),
+    (SALES_MKT_CSV,     "txn_id,fecha,item,cantidad,precio_unit,importe,issue,metodo_pago,source_id\n"),
+    (TRANSFER_MKT_CSV,  "txn_id,fecha,item,cantidad,issue\n"),
+]
+
 def ensure_files():
-    DATA.mkdir(parents=True, exist_ok=True)
-    DOCS.mkdir(parents=True, exist_ok=True)
-    DIARIO_DIR.mkdir(parents=True, exist_ok=True)
-    MKT_DIR.mkdir(parents=True, exist_ok=True)
-    MKT_DIARIO_DIR.mkdir(parents=True, exist_ok=True)
-
-    if not INVENTORY_CSV.exists():
-        INVENTORY_CSV.write_text("item,descripcion,stock,precio,product_id\n", encoding="utf-8")
-    if not SALES_CSV.exists():
-        SALES_CSV.write_text("txn_id,fecha,item,cantidad,precio_unit,importe,issue,metodo_pago,source_id\n", encoding="utf-8")
-    if not PROD_CSV.exists():
-        PROD_CSV.write_text("txn_id,fecha,item,cantidad,issue\n", encoding="utf-8")
-
-    if not INVENTORY_MKT_CSV.exists():
-        INVENTORY_MKT_CSV.write_text("item,descripcion,stock,precio,product_id\n", encoding="utf-8")
-    if not SALES_MKT_CSV.exists():
-        SALES_MKT_CSV.write_text("txn_id,fecha,item,cantidad,precio_unit,importe,issue,metodo_pago,source_id\n", encoding="utf-8")
-    if not TRANSFER_MKT_CSV.exists():
-        TRANSFER_MKT_CSV.write_text("txn_id,fecha,item,cantidad,issue\n", encoding="utf-8")
+    # makedirs crea también los padres (DOCS, MKT_DIR)
+    for d in (DATA, DIARIO_DIR, MKT_DIARIO_DIR):
+        os.makedirs(d, exist_ok=True)
+
+    # Crear-si-no-existe atómico: una sola llamada por archivo
+    for path, header in _SEED_FILES:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(header)
+        _forget_stat(path)
 
 def load_event_issue():
     path = os.environ.get("GITHUB_EVENT_PATH")
     if not path or not os.path.exists(path):
         return None
-    with open(path, "r", encoding="utf-8") as fh:
-        evt = json.load(fh)
+    evt = _json_loads(Path(path).read_bytes())
     return evt.get("issue")
 
+# Regex compilados una vez (por campo en el caso de grab_field)
+_FIELD_CACHE: dict = {}
+_SKU_RE   = re.compile(r"^[A-Z0-9\-:]{3,}$")
+# Renglón de tabla: cualquier línea con '|' -> SKU | Cantidad [| Precio [| ...]]
+_ROW_RE   = re.compile(r"^([^|\n]*)\|([^|\n]*)(?:\|([^|\n]*))?.*$", re.MULTILINE)
+# [^\S\n] = \s sin cruzar renglones (incluye \r, \xa0, etc. como el match por línea)
+_ITEMS_RE = re.compile(r"^[^\S\n]*(\*\*[^\S\n]*)?items([^\S\n]*\*\*)?[^\S\n]*$", re.IGNORECASE | re.MULTILINE)
+
 def grab_field(body: str, key: str) -> str:
     # Acepta "**Fecha**: ..." o "Fecha: ..."
-    pat = rf"^\s*(?:\*\*\s*{re.escape(key)}\s*\*\*|{re.escape(key)})\s*:\s*(.*)$"
-    m = re.search(pat, body, re.IGNORECASE | re.MULTILINE)
+    pat = _FIELD_CACHE.get(key)
+    if pat is None:
+        pat = _FIELD_CACHE[key] = re.compile(
+            rf"^\s*(?:\*\*\s*{re.escape(key)}\s*\*\*|{re.escape(key)})\s*:\s*(.*)$",
+            re.IGNORECASE | re.MULTILINE)
+    m = pat.search(body)
     return (m.group(1) if m else "").strip()
 
 def safe_parse_date(s: str, issue: dict) -> str:
@@ -99,66 +152,62 @@ def is_valid_sku(s: str) -> bool:
         return False
     if " " in s:                     # no espacios
         return False
-    if not re.match(r"^[A-Z0-9\-:]{3,}$", s):
+    if not _SKU_RE.match(s):
         return False
     return True
 
 def parse_items_section(body: str) -> str | None:
     """Encuentra el encabezado 'Items' (con o sin ** **) y devuelve el texto posterior."""
-    lines = body.splitlines()
-    for i, ln in enumerate(lines):
-        if re.match(r"^\s*(\*\*\s*)?items(\s*\*\*)?\s*$", ln, re.IGNORECASE):
-            return "\n".join(lines[i+1:])
-    return None
+    m = _ITEMS_RE.search(body)
+    return body[m.end():] if m else None
 
 def parse_items_table(body: str, has_price: bool):
     """
     Lee una tabla tipo:
       SKU | Cantidad [| Precio]
     Ignora encabezados y filas inválidas. Devuelve lista de dicts.
+    Una sola pasada de _ROW_RE sobre la sección; la tabla termina en la
+    primera línea sin '|' después de haber leído al menos un renglón.
+    Sólo '\\n' separa renglones (un '\\r', '\\x0c' o '\\u2028' sueltos quedan
+    dentro de la línea, a diferencia de str.splitlines()).
     """
     section = parse_items_section(body)
     if not section:
         return []
     out = []
-    for raw in section.splitlines():
-        ln = raw.strip()
-        if not ln or "|" not in ln:
-            if out:
-                break
-            else:
-                continue
-        parts = [p.strip() for p in ln.split("|")]
+    prev_end = 0
+    for m in _ROW_RE.finditer(section):
+        # Más de un salto de línea desde el renglón anterior = hubo una línea sin '|'
+        if out and section.count("\n", prev_end, m.start()) > 1:
+            break
+        prev_end = m.end()
+        sku, qty, price = m.group(1).strip(), m.group(2).strip(), m.group(3)
 
         # ignora encabezados/separadores
-        head = "|".join(p.lower() for p in parts[:3])
-        if ("sku" in head and "cantidad" in head) or ln.startswith("---"):
+        cells = (sku, qty) if price is None else (sku, qty, price.strip())
+        head = "|".join(c.lower() for c in cells)
+        if ("sku" in head and "cantidad" in head) or sku.startswith("---"):
             continue
 
+        if has_price and price is None: continue
+        if not is_valid_sku(sku): continue
         try:
-            if has_price:
-                if len(parts) < 3: continue
-                sku, qty, price = parts[0], parts[1], parts[2]
-                if not is_valid_sku(sku): continue
-                qty_i = int(str(qty).strip())
-                if qty_i <= 0: continue
-                out.append({"item": sku, "cantidad": qty_i, "precio_unit": str(price).strip()})
-            else:
-                if len(parts) < 2: continue
-                sku, qty = parts[0], parts[1]
-                if not is_valid_sku(sku): continue
-                qty_i = int(str(qty).strip())
-                if qty_i <= 0: continue
-                out.append({"item": sku, "cantidad": qty_i})
-        except Exception:
+            qty_i = int(qty)
+        except ValueError:
             continue
+        if qty_i <= 0: continue
+        if has_price:
+            out.append({"item": sku, "cantidad": qty_i, "precio_unit": price.strip()})
+        else:
+            out.append({"item": sku, "cantidad": qty_i})
     return out
 
+@functools.lru_cache(maxsize=None)
 def short_id_from_sku(sku: str) -> str:
     return hashlib.sha1(sku.encode("utf-8")).hexdigest()[:8].upper()
 
 def new_txn_id(prefix: str) -> str:
-    now = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    now = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
     rand = secrets.token_hex(3).upper()
     return f"{prefix}-{now}-{rand}"
 
@@ -167,7 +216,7 @@ def new_txn_id(prefix: str) -> str:
 # ============================================================
 
 def _load_inventory_file(path: Path) -> pd.DataFrame:
-    if path.exists() and path.stat().st_size > 0:
+    if _has_data(path):
         inv = pd.read_csv(path, dtype=str)
     else:
         inv = pd.DataFrame(columns=["item","descripcion","stock","precio","product_id"])
@@ -199,36 +248,98 @@ def _load_inventory_file(path: Path) -> pd.DataFrame:
 
     # product_id
     inv["product_id"] = inv["product_id"].astype(str)
-    inv.loc[inv["product_id"].isna() | (inv["product_id"]==""), "product_id"] = inv["item"].apply(short_id_from_sku)
+    no_pid = inv["product_id"].isna() | (inv["product_id"]=="")
+    if no_pid.any():
+        inv.loc[no_pid, "product_id"] = [short_id_from_sku(s) for s in inv.loc[no_pid, "item"].to_numpy()]
 
     return inv
 
 def load_inventory_general():  return _load_inventory_file(INVENTORY_CSV)
 def load_inventory_mkt():      return _load_inventory_file(INVENTORY_MKT_CSV)
 
+def _write_if_changed(path: Path, data: bytes) -> bool:
+    """Escribe sólo si el contenido cambió (evita escrituras y ruido en git)."""
+    try:
+        if path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    path.write_bytes(data)
+    _forget_stat(path)
+    return True
+
+def _json_bytes(obj) -> bytes:
+    """JSON con indent=2 en UTF-8 (orjson si está instalado)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+                                        | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
 def write_inventory(path: Path, inv: pd.DataFrame):
-    inv.to_csv(path, index=False)
+    _write_if_changed(path, inv.to_csv(index=False).encode("utf-8"))
 
 def write_menu_json(inv_general: pd.DataFrame):
     # Filtra SKUs inválidos para no contaminar el menú
     inv_ok = inv_general[inv_general["item"].apply(is_valid_sku)].copy()
     cols = [c for c in ["product_id","item","descripcion","precio"] if c in inv_ok.columns]
-    MENU_JSON.write_text(json.dumps(inv_ok[cols].fillna("").to_dict(orient="records"),
-                                    ensure_ascii=False, indent=2), encoding="utf-8")
+    _write_if_changed(MENU_JSON, _json_bytes(inv_ok[cols].fillna("").to_dict(orient="records")))
 
 # ============================================================
 # Guardar movimientos (con upsert por source_id)
 # ============================================================
 
+# Columnas de texto de los CSV de movimientos: nunca se infieren como número/fecha
+_TEXT_COLS = ("txn_id","fecha","item","issue","metodo_pago","source_id","descripcion")
+
+def _read_csv(path: Path) -> pd.DataFrame:
+    """Lee un CSV de movimientos con tipos declarados para las columnas de texto.
+    Usa pyarrow si está instalado; si no, o si el archivo trae renglones rotos
+    (p. ej. marcas de conflicto de git), usa el lector de pandas."""
+    if pa is not None:
+        try:
+            opts = pacsv.ConvertOptions(column_types={c: pa.string() for c in _TEXT_COLS},
+                                        strings_can_be_null=True)
+            return pacsv.read_csv(path, convert_options=opts).to_pandas()
+        except pa.ArrowInvalid:
+            pass
+    return pd.read_csv(path, dtype={c: str for c in _TEXT_COLS})
+
 def _upsert_rows(path: Path, rows: list, key="source_id"):
-    """Reemplaza por clave si ya existen (anti-duplicados por edición de issue)."""
-    df_old = pd.read_csv(path) if path.exists() and path.stat().st_size > 0 else pd.DataFrame()
+    """Reemplaza por clave si ya existen (anti-duplicados por edición de issue).
+    Devuelve (DataFrame completo escrito, fechas tocadas por filas nuevas o reemplazadas)."""
+    df_old = _read_csv(path) if _has_data(path) else pd.DataFrame()
     df_new = pd.DataFrame(rows)
+    fechas = set(df_new["fecha"].dropna()) if "fecha" in df_new.columns else set()
     if not df_old.empty and key in df_old.columns and key in df_new.columns:
         keys = set(df_new[key].astype(str))
-        df_old = df_old[~df_old[key].astype(str).isin(keys)]
+        replaced = df_old[key].astype(str).isin(keys)
+        if "fecha" in df_old.columns:
+            fechas |= set(df_old.loc[replaced, "fecha"].dropna())
+        df_old = df_old[~replaced]
     df = pd.concat([df_old, df_new], ignore_index=True)
     df.to_csv(path, index=False)
+    _forget_stat(path)
+    return df, fechas
+
+def _append_rows(path: Path, rows: list, columns: list):
+    """Agrega filas al final del CSV con csv.DictWriter, sin releerlo (sólo su encabezado)."""
+    if not _has_data(path):
+        header, needs_nl, mode = columns, False, "w"
+    else:
+        with open(path, "r", newline="", encoding="utf-8") as fh:
+            header = next(csv.reader(fh), None) or columns
+        with open(path, "rb") as fh:
+            fh.seek(-1, os.SEEK_END)
+            needs_nl = fh.read(1) != b"\n"
+        mode = "a"
+    with open(path, mode, newline="", encoding="utf-8") as fh:
+        if needs_nl:
+            fh.write("\n")
+        w = csv.DictWriter(fh, fieldnames=header, restval="", extrasaction="ignore", lineterminator="\n")
+        if mode == "w":
+            w.writeheader()
+        w.writerows(rows)
+    _forget_stat(path)
 
 def _clean_items(items, require_price: bool = False):
     clean = []
@@ -248,18 +359,23 @@ def _clean_items(items, require_price: bool = False):
         clean.append(rec)
     return clean
 
+def _price_map(inv: pd.DataFrame) -> dict:
+    """{sku: precio} para el precio de respaldo (sin escanear inv por renglón)."""
+    return dict(zip(inv["item"].astype(str), pd.to_numeric(inv["precio"], errors="coerce")))
+
 def append_sales_general(inv: pd.DataFrame, fecha: str, items: list, issue_url: str, metodo_pago: str, txn_id: str):
     items = _clean_items(items, require_price=True)
     if not items:
-        return
+        return None, set()
+    price_map = _price_map(inv)
     rows = []
     for idx, it in enumerate(items):
         sku = it["item"]; qty = int(it["cantidad"])
         precio_s = it.get("precio_unit","")
         precio = pd.to_numeric(precio_s, errors="coerce")
         if pd.isna(precio):
-            row = inv.loc[inv["item"]==sku]
-            precio = float(row["precio"].iloc[0]) if not row.empty and pd.notna(row["precio"].iloc[0]) else 0.0
+            precio = price_map.get(sku, 0.0)
+            if pd.isna(precio): precio = 0.0
         importe = float(qty) * float(precio)
         source_id = f"{issue_url}#{idx}"
         rows.append({
@@ -268,20 +384,21 @@ def append_sales_general(inv: pd.DataFrame, fecha: str, items: list, issue_url:
             "issue": issue_url, "metodo_pago": (metodo_pago or "efectivo"),
             "source_id": source_id
         })
-    _upsert_rows(SALES_CSV, rows, key="source_id")
+    return _upsert_rows(SALES_CSV, rows, key="source_id")
 
 def append_sales_mkt(inv_mkt: pd.DataFrame, fecha: str, items: list, issue_url: str, metodo_pago: str, txn_id: str):
     items = _clean_items(items, require_price=True)
     if not items:
-        return
+        return None, set()
+    price_map = _price_map(inv_mkt)
     rows = []
     for idx, it in enumerate(items):
         sku = it["item"]; qty = int(it["cantidad"])
         precio_s = it.get("precio_unit","")
         precio = pd.to_numeric(precio_s, errors="coerce")
         if pd.isna(precio):
-            row = inv_mkt.loc[inv_mkt["item"]==sku]
-            precio = float(row["precio"].iloc[0]) if not row.empty and pd.notna(row["precio"].iloc[0]) else 0.0
+            precio = price_map.get(sku, 0.0)
+            if pd.isna(precio): precio = 0.0
         importe = float(qty) * float(precio)
         source_id = f"{issue_url}#{idx}"
         rows.append({
@@ -290,43 +407,43 @@ def append_sales_mkt(inv_mkt: pd.DataFrame, fecha: str, items: list, issue_url:
             "issue": issue_url, "metodo_pago": (metodo_pago or "efectivo"),
             "source_id": source_id
         })
-    _upsert_rows(SALES_MKT_CSV, rows, key="source_id")
+    return _upsert_rows(SALES_MKT_CSV, rows, key="source_id")
 
 def append_production(fecha: str, items: list, issue_url: str, txn_id: str):
     items = _clean_items(items, require_price=False)
     if not items:
         return
-    df = pd.read_csv(PROD_CSV) if PROD_CSV.exists() and PROD_CSV.stat().st_size>0 else pd.DataFrame()
-    for idx, it in enumerate(items):
-        source_id = f"{issue_url}#{idx}"  # no se guarda en CSV de prod, pero podríamos
-        df = pd.concat([df, pd.DataFrame([{
-            "txn_id": txn_id, "fecha": fecha, "item": it["item"], "cantidad": int(it["cantidad"]), "issue": issue_url
-        }])], ignore_index=True)
-    df.to_csv(PROD_CSV, index=False)
+    rows = [{
+        "txn_id": txn_id, "fecha": fecha, "item": it["item"], "cantidad": int(it["cantidad"]), "issue": issue_url
+    } for it in items]
+    _append_rows(PROD_CSV, rows, ["txn_id","fecha","item","cantidad","issue"])
 
 def append_transfer_mkt(fecha: str, items: list, issue_url: str, txn_id: str):
     items = _clean_items(items, require_price=False)
     if not items:
         return
-    df = pd.read_csv(TRANSFER_MKT_CSV) if TRANSFER_MKT_CSV.exists() and TRANSFER_MKT_CSV.stat().st_size>0 else pd.DataFrame()
-    for it in items:
-        df = pd.concat([df, pd.DataFrame([{
-            "txn_id": txn_id, "fecha": fecha, "item": it["item"], "cantidad": int(it["cantidad"]), "issue": issue_url
-        }])], ignore_index=True)
-    df.to_csv(TRANSFER_MKT_CSV, index=False)
+    rows = [{
+        "txn_id": txn_id, "fecha": fecha, "item": it["item"], "cantidad": int(it["cantidad"]), "issue": issue_url
+    } for it in items]
+    _append_rows(TRANSFER_MKT_CSV, rows, ["txn_id","fecha","item","cantidad","issue"])
 
 def apply_stock(inv: pd.DataFrame, items: list, sign: int, path: Path) -> pd.DataFrame:
     items = _clean_items(items, require_price=False)
+    # Agrega deltas por SKU (un SKU repetido en el issue suma una sola vez)
+    deltas = Counter()
     for it in items:
-        sku = it["item"]; delta = sign * int(it["cantidad"])
-        mask = inv["item"] == sku
-        if not mask.any():
-            inv = pd.concat([inv, pd.DataFrame([{
-                "item": sku, "descripcion":"", "stock":0, "precio":"", "product_id": short_id_from_sku(sku)
-            }])], ignore_index=True)
-            mask = inv["item"] == sku
-        inv.loc[mask, "stock"] = inv.loc[mask, "stock"].fillna(0).astype(int) + delta
-    inv["stock"] = inv["stock"].astype(int)
+        deltas[it["item"]] += sign * int(it["cantidad"])
+
+    # SKUs nuevos: un solo concat
+    known = set(inv["item"])
+    new_skus = [sku for sku in deltas if sku not in known]
+    if new_skus:
+        inv = pd.concat([inv, pd.DataFrame([{
+            "item": sku, "descripcion":"", "stock":0, "precio":"", "product_id": short_id_from_sku(sku)
+        } for sku in new_skus])], ignore_index=True)
+
+    delta_col = inv["item"].map(dict(deltas)).fillna(0).astype(int)
+    inv["stock"] = inv["stock"].fillna(0).astype(int) + delta_col
     write_inventory(path, inv)
     return inv
 
@@ -334,13 +451,91 @@ def apply_stock(inv: pd.DataFrame, items: list, sign: int, path: Path) -> pd.Dat
 # Reportes
 # ============================================================
 
-def _safe_merge(left: pd.DataFrame, right: pd.DataFrame, on="item"):
-    # Merge sin duplicar columnas de descripción
-    cols = [c for c in right.columns if c != on]
-    merged = left.merge(right[[on] + cols], on=on, how="left")
-    return merged
-
-def build_reports(inv_gen: pd.DataFrame, inv_mkt: pd.DataFrame):
+def _inv_maps(inv: pd.DataFrame, cols=("product_id","descripcion")) -> dict:
+    """{columna: {sku: valor}} para anotar detalles sin DataFrame.merge."""
+    return {c: dict(zip(inv["item"], inv[c])) for c in cols}
+
+def _attach_inv_cols(df: pd.DataFrame, maps: dict, on="item"):
+    """Mismo resultado que df.merge(inv[[on, *cols]], on=on, how="left"):
+    el valor guardado con la venta no se toca y, si la columna ya existe,
+    quedan ambas con sufijos _x (detalle) / _y (inventario)."""
+    out, ren = {}, {}
+    for c, m in maps.items():
+        name = c
+        if c in df.columns:
+            ren[c], name = f"{c}_x", f"{c}_y"
+        out[name] = df[on].map(m)
+    return df.rename(columns=ren).assign(**out)
+
+def _write_csv(path: Path, df: pd.DataFrame, cols=None):
+    """CSV plano con csv.writer (NaN/NA -> vacío, igual que DataFrame.to_csv)."""
+    cols = list(df.columns) if cols is None else list(cols)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, lineterminator="\n")
+        w.writerow(cols)
+        w.writerows(["" if pd.isna(v) else v for v in row]
+                    for row in df[cols].itertuples(index=False, name=None))
+
+def _write_daily_csvs(detail: pd.DataFrame, out_dir: Path, only=None):
+    """Un CSV por fecha: ordena una vez y escribe rebanadas contiguas (sin groupby).
+    only: fechas a reescribir; las demás sólo se escriben si su archivo no existe.
+    None = reescribe todas."""
+    d = detail[detail["fecha"].notna()].sort_values("fecha", kind="stable")
+    if d.empty:
+        return
+    existing = set(os.listdir(out_dir)) if only is not None else set()
+    fechas, starts = np.unique(d["fecha"].to_numpy(dtype=object), return_index=True)
+    ends = list(starts[1:]) + [len(d)]
+    for fecha, a, b in zip(fechas, starts, ends):
+        name = f"{fecha}-ventas.csv"
+        if only is not None and fecha not in only and name in existing:
+            continue
+        _write_csv(out_dir / name, d.iloc[a:b])
+
+def _html_cells(s: pd.Series) -> list:
+    """Textos de una columna para <td>: floats con el mismo formateador que
+    DataFrame.to_html (0.30, no 0.30000000000000004); NaN -> vacío."""
+    if s.dtype.kind == "f" and len(s):
+        return [t.strip() for t in s.to_string(index=False, header=False, na_rep="").split("\n")]
+    return ["" if pd.isna(v) else str(v) for v in s]
+
+def _html_table(df: pd.DataFrame):
+    """Genera el <table> de df en una sola pasada (sin DataFrame.to_html)."""
+    cols = list(df.columns)
+    yield "<table><tr>" + "".join(f"<th>{html.escape(str(c))}</th>" for c in cols) + "</tr>"
+    for row in zip(*(_html_cells(df.iloc[:, i]) for i in range(len(cols)))):
+        yield "<tr>" + "".join(f"<td>{html.escape(v)}</td>" for v in row) + "</tr>"
+    yield "</table>"
+
+# Debajo de este número de filas, np.unique + bincount le gana a groupby
+_SMALL_GROUPBY_MAX = 10_000
+
+def _group_sum(df: pd.DataFrame, key: str, cols: list) -> pd.DataFrame:
+    """Equivale a df.groupby(key, as_index=False)[cols].sum() (llaves NaN descartadas).
+    bincount sólo para columnas enteras (suma exacta); las float pasan por
+    groupby sobre los códigos, que suma compensado (Kahan) igual que antes."""
+    if len(df) >= _SMALL_GROUPBY_MAX:
+        return df.groupby(key, as_index=False)[cols].sum()
+    keys = df[key].to_numpy(dtype=object)
+    ok = pd.notna(keys)
+    keys = keys[ok]
+    if keys.size == 0:
+        return pd.DataFrame({c: pd.Series(dtype=df[c].dtype) for c in [key] + cols})
+    uniq, codes = np.unique(keys, return_inverse=True)
+    out = {key: uniq}
+    for c in cols:
+        v = df[c].to_numpy()[ok]
+        if v.dtype.kind in "iu":
+            out[c] = np.bincount(codes, weights=v, minlength=len(uniq)).astype(v.dtype)
+        else:
+            out[c] = pd.Series(v).groupby(codes).sum().to_numpy()
+    return pd.DataFrame(out)
+
+def build_reports(inv_gen: pd.DataFrame, inv_mkt: pd.DataFrame,
+                  sales: pd.DataFrame | None = None, sales_mkt: pd.DataFrame | None = None,
+                  dirty_dates: set | None = None):
+    # sales / sales_mkt: ventas ya en memoria (p. ej. recién escritas); si no, se leen del CSV
+    # dirty_dates: fechas cuyos diarios cambiaron (None = regenerar todos los diarios)
     # Sanea inventarios
     inv_gen = inv_gen[inv_gen["item"].apply(is_valid_sku)].copy()
     inv_mkt = inv_mkt[inv_mkt["item"].apply(is_valid_sku)].copy()
@@ -348,8 +543,9 @@ def build_reports(inv_gen: pd.DataFrame, inv_mkt: pd.DataFrame):
     inv_mkt["stock"] = pd.to_numeric(inv_mkt["stock"], errors="coerce").fillna(0).astype(int)
 
     # ----- general -----
-    sales = pd.read_csv(SALES_CSV) if SALES_CSV.exists() else pd.DataFrame(
-        columns=["txn_id","fecha","item","cantidad","precio_unit","importe","issue","metodo_pago","source_id"])
+    if sales is None:
+        sales = _read_csv(SALES_CSV) if _has_data(SALES_CSV) else pd.DataFrame(
+            columns=["txn_id","fecha","item","cantidad","precio_unit","importe","issue","metodo_pago","source_id"])
     if not sales.empty:
         # Dedup por source_id (defensa adicional)
         if "source_id" in sales.columns:
@@ -360,28 +556,32 @@ def build_reports(inv_gen: pd.DataFrame, inv_mkt: pd.DataFrame):
         if "metodo_pago" not in sales.columns:
             sales["metodo_pago"] = "efectivo"
 
-    prod = pd.read_csv(PROD_CSV) if PROD_CSV.exists() else pd.DataFrame(
+    prod = _read_csv(PROD_CSV) if _has_data(PROD_CSV) else pd.DataFrame(
         columns=["txn_id","fecha","item","cantidad","issue"])
     if not prod.empty:
         prod["cantidad"] = pd.to_numeric(prod["cantidad"], errors="coerce").fillna(0).astype(int)
 
-    inv_key = inv_gen[["item","product_id","descripcion"]]
-    sales_detail = _safe_merge(sales, inv_key, on="item")
-    prod_detail  = _safe_merge(prod,  inv_key, on="item")
+    inv_maps = _inv_maps(inv_gen)
+    sales_detail = _attach_inv_cols(sales, inv_maps)
+    prod_detail  = _attach_inv_cols(prod,  inv_maps)
 
     inv_out = inv_gen[["product_id","item","descripcion","precio","stock"]].sort_values("item")
-    inv_out.to_csv(INV_OUT_CSV, index=False)
-    sales_detail.to_csv(SALES_DETAIL_CSV, index=False)
-    prod_detail.to_csv(PROD_DETAIL_CSV, index=False)
+    _write_csv(INV_OUT_CSV, inv_out)
+    _write_csv(SALES_DETAIL_CSV, sales_detail)
+    _write_csv(PROD_DETAIL_CSV, prod_detail)
 
     # Resúmenes
-    by_item = (sales.groupby("item", as_index=False)[["cantidad","importe"]]
-               .sum().sort_values(["cantidad","importe"], ascending=False))
-    by_item.to_csv(SALES_ITEM_CSV, index=False)
-
-    by_day = (sales.groupby("fecha", as_index=False)[["cantidad","importe"]]
-              .sum().sort_values("fecha"))
-    by_day.to_csv(SALES_DAY_CSV, index=False)
+    # Se recalculan completos a propósito: sales.csv no es append-only
+    # (_upsert_rows reescribe filas por source_id), así que un caché por
+    # offset de bytes podría sumar filas reemplazadas. El detalle de ventas
+    # ya exige leer todo el archivo, y sumar sobre él es barato.
+    by_item = (_group_sum(sales, "item", ["cantidad","importe"])
+               .sort_values(["cantidad","importe"], ascending=False))
+    _write_csv(SALES_ITEM_CSV, by_item)
+
+    by_day = (_group_sum(sales, "fecha", ["cantidad","importe"])
+              .sort_values("fecha"))
+    _write_csv(SALES_DAY_CSV, by_day)
 
     # Efectivo vs Tarjeta (general)
     # (Se mantiene sólo en JSON; tu build_reports.py puede usarlo también)
@@ -392,7 +592,7 @@ def build_reports(inv_gen: pd.DataFrame, inv_mkt: pd.DataFrame):
         # no se escribe CSV aparte aquí, pero lo agregamos al JSON
 
     report = {
-        "generated_at": datetime.utcnow().isoformat()+"Z",
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
         "summary": {
             "items_distintos": int(inv_gen["item"].nunique()) if not inv_gen.empty else 0,
             "items_low_stock": int((inv_gen["stock"]<=5).sum()) if not inv_gen.empty else 0,
@@ -402,44 +602,57 @@ def build_reports(inv_gen: pd.DataFrame, inv_mkt: pd.DataFrame):
         },
         "pagos": pagos_sum.to_dict(orient="records") if isinstance(pagos_sum, pd.DataFrame) else []
     }
-    REPORT_JSON.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if orjson is not None:
+        REPORT_JSON.write_bytes(_json_bytes(report))
+    else:
+        with open(REPORT_JSON, "w", encoding="utf-8") as fp:
+            json.dump(report, fp, ensure_ascii=False, indent=2)
 
     # HTML
     cols_exist = [c for c in ["txn_id","fecha","product_id","item","descripcion","cantidad","precio_unit","importe","metodo_pago","issue"] if c in sales_detail.columns]
-    html = f"""<!doctype html><html lang="es"><meta charset="utf-8">
+    head = f"""<!doctype html><html lang="es"><meta charset="utf-8">
     <meta name="viewport" content="width=device-width,initial-scale=1">
     <title>Reporte Inventario/Ventas</title>
     <style>body{{font-family:system-ui;margin:20px}} table{{border-collapse:collapse;width:100%}}
     th,td{{border:1px solid #ddd;padding:6px;text-align:left}} th{{background:#f7f7f7}} .kpi{{margin:0 0 6px}}</style>
     <h1>Reporte (General)</h1>
-    <p class="kpi">Generado: {report['generated_at']}</p>
-    <h2>Inventario actual</h2>
-    {inv_out.to_html(index=False)}
-    <h2>Ventas (detalle)</h2>
-    {sales_detail[cols_exist].to_html(index=False)}
-    <h2>Producción (detalle)</h2>
-    {prod_detail[["txn_id","fecha","product_id","item","descripcion","cantidad","issue"]].to_html(index=False) if not prod_detail.empty else "<p>Sin producción</p>"}
-    <h2>Ventas por día</h2>
-    {by_day.to_html(index=False)}
-    <h2>Ventas por item</h2>
-    {by_item.to_html(index=False)}
-    </html>"""
-    REPORT_HTML.write_text(html, encoding="utf-8")
+    <p class="kpi">Generado: {report['generated_at']}</p>"""
+    sections = [
+        ("Inventario actual", inv_out),
+        ("Ventas (detalle)", sales_detail[cols_exist]),
+        ("Producción (detalle)", prod_detail[["txn_id","fecha","product_id","item","descripcion","cantidad","issue"]]
+                                 if not prod_detail.empty else None),
+        ("Ventas por día", by_day),
+        ("Ventas por item", by_item),
+    ]
+    # Se re-escribe siempre: un caché por huella de las tablas ignoraría cambios de
+    # plantilla/markup y dejaría 'Generado' desfasado de report.json; además cada
+    # evento real cambia el stock, así que sólo ahorraría corridas sin cambios.
+    # Se escribe por partes directo al archivo (sin armar todo el HTML en memoria)
+    with open(REPORT_HTML, "w", encoding="utf-8") as fh:
+        fh.write(head)
+        for title, df in sections:
+            fh.write(f"\n    <h2>{title}</h2>\n    ")
+            if df is None:
+                fh.write("<p>Sin producción</p>")
+            else:
+                fh.writelines(_html_table(df))
+        fh.write("\n    </html>")
 
     # Diarios general (dedup por source_id antes de escribir)
     if not sales_detail.empty:
-        sd = sales_detail.copy()
+        sd = sales_detail
         if "source_id" in sd.columns:
             sd = sd.drop_duplicates(subset="source_id", keep="last")
-        for fecha, group in sd.groupby("fecha"):
-            (DIARIO_DIR / f"{fecha}-ventas.csv").write_text(group.to_csv(index=False), encoding="utf-8")
+        _write_daily_csvs(sd, DIARIO_DIR, only=dirty_dates)
 
     # ----- mercado -----
     inv_mkt_out = inv_mkt[["product_id","item","descripcion","precio","stock"]].sort_values("item")
-    inv_mkt_out.to_csv(INV_MKT_OUT_CSV, index=False)
+    _write_csv(INV_MKT_OUT_CSV, inv_mkt_out)
 
-    sales_mkt = pd.read_csv(SALES_MKT_CSV) if SALES_MKT_CSV.exists() else pd.DataFrame(
-        columns=["txn_id","fecha","item","cantidad","precio_unit","importe","issue","metodo_pago","source_id"])
+    if sales_mkt is None:
+        sales_mkt = _read_csv(SALES_MKT_CSV) if _has_data(SALES_MKT_CSV) else pd.DataFrame(
+            columns=["txn_id","fecha","item","cantidad","precio_unit","importe","issue","metodo_pago","source_id"])
     if not sales_mkt.empty:
         if "source_id" in sales_mkt.columns:
             sales_mkt = sales_mkt.drop_duplicates(subset="source_id", keep="last")
@@ -449,22 +662,21 @@ def build_reports(inv_gen: pd.DataFrame, inv_mkt: pd.DataFrame):
         if "metodo_pago" not in sales_mkt.columns:
             sales_mkt["metodo_pago"] = "efectivo"
 
-    sales_mkt_detail = _safe_merge(sales_mkt, inv_mkt[["item","product_id","descripcion"]], on="item")
-    sales_mkt_detail.to_csv(SALES_MKT_DETAIL_CSV, index=False)
+    sales_mkt_detail = _attach_inv_cols(sales_mkt, _inv_maps(inv_mkt))
+    _write_csv(SALES_MKT_DETAIL_CSV, sales_mkt_detail)
 
     # por día (mercado)
     if not sales_mkt.empty:
-        by_day_mkt = (sales_mkt.groupby("fecha", as_index=False)[["cantidad","importe"]]
-                      .sum().sort_values("fecha"))
-        by_day_mkt.to_csv(SALES_MKT_DAY_CSV, index=False)
+        by_day_mkt = (_group_sum(sales_mkt, "fecha", ["cantidad","importe"])
+                      .sort_values("fecha"))
+        _write_csv(SALES_MKT_DAY_CSV, by_day_mkt)
 
     # diarios mercado (sin duplicados)
     if not sales_mkt_detail.empty:
-        smd = sales_mkt_detail.copy()
+        smd = sales_mkt_detail
         if "source_id" in smd.columns:
             smd = smd.drop_duplicates(subset="source_id", keep="last")
-        for fecha, group in smd.groupby("fecha"):
-            (MKT_DIARIO_DIR / f"{fecha}-ventas.csv").write_text(group.to_csv(index=False), encoding="utf-8")
+        _write_daily_csvs(smd, MKT_DIARIO_DIR, only=dirty_dates)
 
 # ============================================================
 # Parseo del issue
@@ -537,7 +749,9 @@ def parse_issue(issue):
 # Main
 # ============================================================
 
-def main():
+def main(argv=None):
+    # --rebuild-reports: reconstruye reportes aunque el issue no traiga etiqueta conocida
+    rebuild = "--rebuild-reports" in (sys.argv[1:] if argv is None else argv)
     ensure_files()
     inv_gen = load_inventory_general()
     inv_mkt = load_inventory_mkt()
@@ -554,9 +768,9 @@ def main():
 
     if t.startswith("venta_mkt"):
         txn = new_txn_id("SM")  # Sales Mercado
-        append_sales_mkt(inv_mkt, data["fecha"], data["items"], data["issue_url"], data.get("metodo_pago","efectivo"), txn)
+        sales_mkt, dirty = append_sales_mkt(inv_mkt, data["fecha"], data["items"], data["issue_url"], data.get("metodo_pago","efectivo"), txn)
         inv_mkt = apply_stock(inv_mkt, data["items"], sign=-1, path=INVENTORY_MKT_CSV)
-        build_reports(inv_gen, inv_mkt); return
+        build_reports(inv_gen, inv_mkt, sales_mkt=sales_mkt, dirty_dates=dirty); return
 
     if t.startswith("abasto_mkt"):
         txn = new_txn_id("TM")  # Transfer Mercado
@@ -564,22 +778,23 @@ def main():
         inv_gen = apply_stock(inv_gen, data["items"], sign=-1, path=INVENTORY_CSV)
         inv_mkt = apply_stock(inv_mkt, data["items"], sign=+1, path=INVENTORY_MKT_CSV)
         append_transfer_mkt(data["fecha"], data["items"], data["issue_url"], txn)
-        build_reports(inv_gen, inv_mkt); return
+        build_reports(inv_gen, inv_mkt, dirty_dates=set()); return
 
     if t.startswith("venta"):
         txn = new_txn_id("S")
-        append_sales_general(inv_gen, data["fecha"], data["items"], data["issue_url"], data.get("metodo_pago","efectivo"), txn)
+        sales, dirty = append_sales_general(inv_gen, data["fecha"], data["items"], data["issue_url"], data.get("metodo_pago","efectivo"), txn)
         inv_gen = apply_stock(inv_gen, data["items"], sign=-1, path=INVENTORY_CSV)
-        build_reports(inv_gen, inv_mkt); return
+        build_reports(inv_gen, inv_mkt, sales=sales, dirty_dates=dirty); return
 
     if t.startswith("prod"):
         txn = new_txn_id("P")
         append_production(data["fecha"], data["items"], data["issue_url"], txn)
         inv_gen = apply_stock(inv_gen, data["items"], sign=+1, path=INVENTORY_CSV)
-        build_reports(inv_gen, inv_mkt); return
+        build_reports(inv_gen, inv_mkt, dirty_dates=set()); return
 
-    # Si no calzó ninguna etiqueta esperada, sólo reconstruye
-    build_reports(inv_gen, inv_mkt)
+    # Si no calzó ninguna etiqueta esperada no cambió nada: no se regeneran reportes
+    if rebuild:
+        build_reports(inv_gen, inv_mkt)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
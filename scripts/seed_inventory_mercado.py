@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import csv
+import importlib.util
+import sys
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
@@ -9,6 +13,9 @@ DATA = ROOT / "data"
 INV_GENERAL = DATA / "inventory.csv"
 INV_MERCADO = DATA / "inventory_mercado.csv"
 
+# SKUs como texto Arrow (comparaciones/orden en C++) si hay pyarrow; si no, StringDtype
+ITEM_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else "string"
+
 # === STOCK MERCADO (según tu lista) ===
 # OJO: los SKUs coinciden con los que ya te generé.
 STOCK_MKT = {
@@ -99,50 +106,75 @@ STOCK_MKT = {
     "PALETA-SIN-AZUCAR-VAINILLAKETO": 0,
 }
 
+# Misma lista como Series (índice de texto, valores int64), construida una sola vez
+_STOCK_SERIES = pd.Series(STOCK_MKT, dtype="int64", name="stock")
+_STOCK_SERIES.index = _STOCK_SERIES.index.astype("string")
+
+def _write_csv(path: Path, df: pd.DataFrame):
+    """CSV plano con csv.writer (NA -> vacío, igual que DataFrame.to_csv)."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, lineterminator="\n")
+        w.writerow(df.columns)
+        w.writerows(["" if pd.isna(v) else v for v in row]
+                    for row in df.itertuples(index=False, name=None))
+
 def main():
     if not INV_GENERAL.exists():
         raise SystemExit("ERROR: data/inventory.csv no existe. Súbelo primero.")
 
-    inv = pd.read_csv(INV_GENERAL)
-    # normaliza tipos
-    inv["item"] = inv["item"].astype(str)
+    # Sólo las columnas que usamos; stock/product_id del general no se leen
+    inv = pd.read_csv(INV_GENERAL, usecols=lambda c: c in ("item","descripcion","precio"),
+                      dtype={"item": ITEM_DTYPE, "descripcion": ITEM_DTYPE})
+    # normaliza tipos (el dtype de read_csv ya lo deja como texto; sólo convierte si quedó object)
+    if inv["item"].dtype == object:
+        inv["item"] = inv["item"].astype(ITEM_DTYPE)
     if "descripcion" not in inv.columns: inv["descripcion"] = ""
     if "precio" not in inv.columns: inv["precio"] = ""
 
-    # 1) Paletas del inventario general
-    paletas = inv[inv["item"].str.startswith("PALETA-")].copy()
-    if paletas.empty:
+    # 1) Paletas del inventario general (prefijo comparado en C sobre arreglo U; NA -> "<NA>")
+    items = inv["item"].to_numpy(dtype=str, na_value="<NA>")
+    mask = np.char.startswith(items, "PALETA-")
+    # Se ordenan aquí (argsort estable sobre arreglo U de tamaño fijo) para no reordenar al final
+    idx = np.flatnonzero(mask)
+    idx = idx[np.argsort(items[idx], kind="stable")]
+    pal_items = items[idx]
+    # 2) Arrancamos inventorío Mercado con las paletas del general (stock=0), directo de los arreglos
+    mkt = pd.DataFrame({"item": pal_items,
+                        "descripcion": inv["descripcion"].to_numpy()[idx],
+                        "precio": inv["precio"].to_numpy()[idx],
+                        "stock": np.zeros(len(idx), dtype=np.int64)})
+    if mkt.empty:
         print("WARN: No encontré paletas en inventory.csv (items que inician con 'PALETA-').")
 
-    # 2) Arrancamos inventorío Mercado con las paletas del general (stock=0)
-    mkt = paletas[["item","descripcion","precio"]].copy()
-    mkt["stock"] = 0
+    # 3) Sobrescribe stock con lo de tu lista (un solo map, sin recorrer SKU por SKU)
+    mkt["stock"] = mkt["item"].map(_STOCK_SERIES).fillna(mkt["stock"]).astype("int64")
 
-    # 3) Sobrescribe stock con lo de tu lista
-    missing = []
-    for sku, stk in STOCK_MKT.items():
-        if (mkt["item"] == sku).any():
-            mkt.loc[mkt["item"] == sku, "stock"] = int(stk)
-        else:
-            # SKU no existe en el general → lo añadimos sin precio (te avisamos)
-            missing.append(sku)
-            mkt = pd.concat([
-                mkt,
-                pd.DataFrame([{"item": sku, "descripcion": "", "precio": "", "stock": int(stk)}])
-            ], ignore_index=True)
-
-    # 4) Orden bonito por item
-    mkt = mkt[["item","descripcion","stock","precio"]].sort_values("item").reset_index(drop=True)
+    # SKUs que no existen en el general → los añadimos sin precio (te avisamos), en un solo concat
+    # reutiliza el arreglo crudo ya extraído (sin volver a pasar por la Series)
+    mkt_items = set(pal_items.tolist())
+    missing = [s for s in STOCK_MKT if s not in mkt_items]
+    if missing:
+        add = sorted(missing)
+        extra = pd.DataFrame({"item": add, "descripcion": "", "precio": "",
+                              "stock": [STOCK_MKT[s] for s in add]})
+        # 4) Orden bonito por item: mezcla lineal de dos listas ya ordenadas (sin re-sort)
+        pos = np.searchsorted(pal_items, add, side="right") + np.arange(len(add))
+        dest = np.ones(len(mkt) + len(add), dtype=bool)
+        dest[pos] = False
+        perm = np.empty(len(dest), dtype=np.intp)
+        perm[dest] = np.arange(len(mkt))
+        perm[pos] = np.arange(len(mkt), len(dest))
+        mkt = pd.concat([mkt, extra], ignore_index=True).take(perm).reset_index(drop=True)
+    mkt = mkt[["item","descripcion","stock","precio"]]
 
     # 5) Escribe archivo
     DATA.mkdir(parents=True, exist_ok=True)
-    mkt.to_csv(INV_MERCADO, index=False, encoding="utf-8")
+    _write_csv(INV_MERCADO, mkt)
     print(f"OK: Escribí {INV_MERCADO} con {len(mkt)} filas.")
 
     if missing:
         print("\nAVISO: Estos SKUs no estaban en inventory.csv y se agregaron SIN precio.")
-        for s in missing:
-            print(" -", s)
+        sys.stdout.write("".join(f" - {s}\n" for s in missing))
         print("Tip: agrega esos SKUs al inventario general para heredar descripción y precio.")
 
 if __name__ == "__main__":